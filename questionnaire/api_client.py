@@ -1,6 +1,14 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from requests_toolbelt import MultipartEncoder
+    HAS_TOOLBELT = True
+except Exception:
+    HAS_TOOLBELT = False
 import streamlit as st
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import json
 
@@ -8,6 +16,26 @@ class APIClient:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip('/')
         self.session = requests.Session()
+        # Tune the connection pool beyond urllib3's default of 10 sockets and
+        # retry transient gateway errors so Streamlit rerun bursts reuse
+        # keep-alive connections instead of opening new ones. Retries are
+        # GET-only: every POST here kicks off expensive, non-idempotent work
+        # (indexing, LLM calls) that must not run twice. 503 is excluded
+        # because the API uses it for application errors (services not
+        # initialized, missing key), which retrying cannot fix.
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 504],
+                allowed_methods=frozenset(["GET"]),
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
     
     def _handle_response(self, response: requests.Response) -> Dict[str, Any]:
         """Handle API response and raise appropriate errors"""
@@ -36,6 +64,18 @@ class APIClient:
         """Check API health status"""
         response = self.session.get(f"{self.base_url}/health")
         return self._handle_response(response)
+
+    def fetch_status_and_collections(self) -> Tuple[Dict[str, Any], List[str]]:
+        """Fetch health status and collections concurrently.
+
+        Every Streamlit rerun needs both /health and /collections; issuing
+        them in parallel over the pooled session halves the page's startup
+        latency. Raises like health_check/list_collections on failure.
+        """
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            health_future = pool.submit(self.health_check)
+            collections_future = pool.submit(self.list_collections)
+            return health_future.result(), collections_future.result()
     
     def upload_pdf(self, file_path: Path) -> Dict[str, Any]:
         """Upload a PDF file"""
@@ -46,8 +86,22 @@ class APIClient:
     
     def upload_pdf_from_streamlit(self, uploaded_file) -> Dict[str, Any]:
         """Upload a PDF file from Streamlit file uploader"""
-        files = {'file': (uploaded_file.name, uploaded_file.getvalue(), 'application/pdf')}
-        response = self.session.post(f"{self.base_url}/upload-pdf", files=files)
+        uploaded_file.seek(0)
+        if HAS_TOOLBELT:
+            # MultipartEncoder reads the file in chunks as the socket
+            # drains, so the PDF never sits fully in client memory.
+            body = MultipartEncoder(
+                fields={'file': (uploaded_file.name, uploaded_file, 'application/pdf')}
+            )
+            response = self.session.post(
+                f"{self.base_url}/upload-pdf", data=body,
+                headers={"Content-Type": body.content_type},
+            )
+        else:
+            # requests builds files= multipart bodies entirely in memory,
+            # so without the toolbelt this buffers the whole PDF.
+            files = {'file': (uploaded_file.name, uploaded_file, 'application/pdf')}
+            response = self.session.post(f"{self.base_url}/upload-pdf", files=files)
         return self._handle_response(response)
     
     def index_pdf(self, filename: str, collection_name: str) -> Dict[str, Any]:
@@ -71,7 +125,31 @@ class APIClient:
         response = self.session.post(f"{self.base_url}/generate-questions", json=data)
         result = self._handle_response(response)
         return result.get("questions", [])
-    
+
+    def stream_questions(self, collection_name: str, num_questions: int = 3):
+        """Yield questions one by one from the streaming endpoint.
+
+        Each NDJSON line arrives as soon as the model finishes a question,
+        so callers can render incrementally instead of waiting for the
+        whole list.
+        """
+        data = {
+            "collection_name": collection_name,
+            "num_questions": max(1, min(10, num_questions))
+        }
+        # Ask for an uncompressed body: a gzip layer (server or proxy)
+        # buffers the small NDJSON lines until the stream closes, which
+        # would turn incremental delivery back into one final burst.
+        response = self.session.post(
+            f"{self.base_url}/generate-questions/stream", json=data, stream=True,
+            headers={"Accept-Encoding": "identity"},
+        )
+        if response.status_code != 200:
+            self._handle_response(response)
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)["question"]
+
     def evaluate_answers(self, collection_name: str, answers: List[Dict[str, str]]) -> List[Dict[str, Any]]:
         """Evaluate student answers"""
         data = {
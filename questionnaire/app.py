@@ -1,7 +1,10 @@
 import os
+import shutil
 from pathlib import Path
 import streamlit as st
 
+from ui_styles import apply_section_styling
+
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from services.pdf_service import PDFService
 from services.question_service import QuestionService
@@ -18,74 +21,53 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 if not os.getenv("OPENAI_API_KEY"):
     st.warning("OPENAI_API_KEY not set. Embeddings/LLM will fail.")
 
-embeddings = OpenAIEmbeddings()
-llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
 
-# Initialize services
-pdf_service = PDFService(DB_DIR, embeddings)
-question_service = QuestionService(llm)
-evaluation_service = EvaluationService(llm)
+# Cache the OpenAI clients and services across Streamlit reruns; otherwise
+# every widget interaction rebuilds them (and their HTTP connection pools).
+@st.cache_resource
+def get_embeddings() -> OpenAIEmbeddings:
+    return OpenAIEmbeddings()
+
+
+@st.cache_resource
+def get_llm() -> ChatOpenAI:
+    return ChatOpenAI(model="gpt-4o", temperature=0.7)
+
+
+@st.cache_resource
+def get_services():
+    embeddings = get_embeddings()
+    llm = get_llm()
+    return (
+        PDFService(DB_DIR, embeddings),
+        QuestionService(llm),
+        # Defaults to gpt-4o-mini; grading doesn't need the large model.
+        EvaluationService(),
+    )
+
+
+embeddings = get_embeddings()
+llm = get_llm()
+pdf_service, question_service, evaluation_service = get_services()
+
+
+@st.cache_resource
+def load_cached_vectorstore(collection: str):
+    """Load a FAISS collection once per process instead of on every rerun."""
+    return pdf_service.load_vectorstore(collection)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def generate_cached_questions(collection: str, n: int) -> list:
+    """Generate questions once per (collection, n); reruns reuse the result."""
+    vs = load_cached_vectorstore(collection)
+    return question_service.generate_questions(vs, n)
 
 
 
 
 # ---------- Custom Styling ----------
-def apply_section_styling():
-    st.markdown("""
-    <style>
-    .upload-section {
-        background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #2196F3;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(33, 150, 243, 0.1);
-    }
-    .index-section {
-        background: linear-gradient(135deg, #E8F5E2 0%, #C8E6C9 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #4CAF50;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(76, 175, 80, 0.1);
-    }
-    .question-section {
-        background: linear-gradient(135deg, #F3E5F5 0%, #E1BEE7 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #9C27B0;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(156, 39, 176, 0.1);
-    }
-    .results-section {
-        background: linear-gradient(135deg, #FFF3E0 0%, #FFE0B2 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #FF9800;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(255, 152, 0, 0.1);
-    }
-    .section-header {
-        color: #1A237E;
-        font-weight: 600;
-        margin-bottom: 15px;
-        font-size: 1.3rem;
-    }
-    .stButton > button {
-        background: linear-gradient(45deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 0.5rem 1.5rem;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(102, 126, 234, 0.3);
-    }
-    </style>
-    """, unsafe_allow_html=True)
+# Shared with the direct app; see ui_styles.py / assets/styles.css.
 
 # ---------- Streamlit UI ----------
 apply_section_styling()
@@ -99,8 +81,14 @@ pdf = st.file_uploader("Upload a PDF", type=["pdf"])
 
 if pdf:
     saved_path = (UPLOAD_DIR / pdf.name).resolve()
-    with open(saved_path, "wb") as f:
-        f.write(pdf.getbuffer())
+    # Stream to disk in 1MB chunks rather than buffering the whole PDF, and
+    # write via a temp file + os.replace so a mid-rerun interruption never
+    # leaves a truncated PDF for the indexer to pick up.
+    tmp_path = saved_path.with_suffix(".pdf.tmp")
+    pdf.seek(0)
+    with open(tmp_path, "wb") as f:
+        shutil.copyfileobj(pdf, f, length=1024 * 1024)
+    os.replace(tmp_path, saved_path)
 
     st.success(f"✅ Saved: {saved_path}")
     default_collection = pdf.name.rsplit(".pdf", 1)[0]
@@ -118,6 +106,10 @@ if pdf:
     if st.button("🚀 Index PDF"):
         try:
             msg = pdf_service.index_pdf(saved_path, collection)
+            # Drop any cached store for this collection so the fresh index is
+            # used, and any cached questions generated from the old contents.
+            load_cached_vectorstore.clear()
+            generate_cached_questions.clear()
             st.success(f"✅ {msg}")
         except Exception as e:
             st.exception(e)
@@ -137,13 +129,18 @@ else:
     chosen = st.selectbox("📋 Choose collection", options=collections)
     n_q = st.number_input("❓ How many questions? (max 10)", min_value=1, max_value=10, value=3, step=1)
 
-    if st.button("✨ Generate Questions"):
+    gen_col, regen_col = st.columns(2)
+    generate_clicked = gen_col.button("✨ Generate Questions")
+    regenerate_clicked = regen_col.button("🔄 Regenerate")
+
+    if generate_clicked or regenerate_clicked:
         if not os.getenv("OPENAI_API_KEY"):
             st.error("🔑 OPENAI_API_KEY not set.")
         else:
             try:
-                vs = pdf_service.load_vectorstore(chosen)
-                st.session_state["questions"] = question_service.generate_questions(vs, int(n_q))
+                if regenerate_clicked:
+                    generate_cached_questions.clear()
+                st.session_state["questions"] = generate_cached_questions(chosen, int(n_q))
             except Exception as e:
                 st.exception(e)
 
@@ -159,7 +156,7 @@ else:
             st.markdown('<div class="results-section">', unsafe_allow_html=True)
             st.markdown('<h3 class="section-header">📊 Evaluation Results</h3>', unsafe_allow_html=True)
             
-            vs = pdf_service.load_vectorstore(chosen)
+            vs = load_cached_vectorstore(chosen)
             results = evaluation_service.evaluate_answers(vs, answers)
             total_score = 0
             count = 0
@@ -2,10 +2,14 @@ import os
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, UploadFile, File, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 from typing import List, Dict, Any
 import tempfile
-import shutil
+import time
+import aiofiles
 
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from services.pdf_service import PDFService
@@ -21,7 +25,8 @@ from models import (
 app = FastAPI(
     title="PDF Tutor API",
     description="API for PDF-based learning and evaluation system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,  # orjson serializes 2-5x faster than stdlib json
 )
 
 # CORS middleware for frontend access
@@ -33,6 +38,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class _GZipExceptStreaming(GZipMiddleware):
+    """GZipMiddleware that leaves the NDJSON streaming route alone.
+
+    Starlette's gzip wrapper never flushes the compressor mid-stream, and
+    zlib buffers ~100-byte writes until close — so compressing
+    /generate-questions/stream would hold every question back and deliver
+    them in one burst at the end, defeating the point of streaming.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/generate-questions/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Question/evaluation payloads are mostly long English text that compresses
+# 5-10x; skip small responses where the gzip header isn't worth it.
+app.add_middleware(_GZipExceptStreaming, minimum_size=1024, compresslevel=5)
+
 # ---------- Paths ----------
 APP_DIR = Path(__file__).parent
 DB_DIR = APP_DIR / "vectorstores"
@@ -41,7 +66,9 @@ UPLOAD_DIR = APP_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 # ---------- Initialize Services ----------
-if not os.getenv("OPENAI_API_KEY"):
+# The key is static per process; read it once instead of on every request.
+OPENAI_CONFIGURED = bool(os.getenv("OPENAI_API_KEY"))
+if not OPENAI_CONFIGURED:
     print("Warning: OPENAI_API_KEY not set. API will fail without it.")
 
 try:
@@ -50,7 +77,8 @@ try:
     
     pdf_service = PDFService(DB_DIR, embeddings)
     question_service = QuestionService(llm)
-    evaluation_service = EvaluationService(llm)
+    # Defaults to gpt-4o-mini; grading doesn't need the large model.
+    evaluation_service = EvaluationService()
 except Exception as e:
     print(f"Warning: Failed to initialize AI services: {e}")
     pdf_service = question_service = evaluation_service = None
@@ -66,7 +94,7 @@ async def root():
 async def health_check():
     return HealthResponse(
         status="healthy",
-        openai_configured=bool(os.getenv("OPENAI_API_KEY")),
+        openai_configured=OPENAI_CONFIGURED,
         services_initialized=all([pdf_service, question_service, evaluation_service])
     )
 
@@ -80,12 +108,14 @@ async def upload_pdf(file: UploadFile = File(...)):
             detail="Only PDF files are allowed"
         )
     
-    # Save uploaded file
+    # Save uploaded file, streaming in 1MB chunks; aiofiles keeps the event
+    # loop free so concurrent requests aren't stalled behind a large upload.
     file_path = UPLOAD_DIR / file.filename
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(1 << 20):
+                await buffer.write(chunk)
+
         return UploadResponse(
             message=f"File {file.filename} uploaded successfully",
             filename=file.filename,
@@ -114,7 +144,11 @@ async def index_pdf(filename: str, request: IndexRequest):
         )
     
     try:
-        message = pdf_service.index_pdf(file_path, request.collection_name)
+        # index_pdf is CPU/GIL-heavy for seconds; keep the event loop free
+        message = await run_in_threadpool(pdf_service.index_pdf, file_path, request.collection_name)
+        # The vector store cache invalidates on mtime; cached questions
+        # for the old index contents have to be dropped explicitly.
+        _drop_cached_questions(request.collection_name)
         return IndexResponse(message=message, collection_name=request.collection_name)
     except Exception as e:
         raise HTTPException(
@@ -142,6 +176,30 @@ async def list_collections():
         )
 
 # ---------- Question Generation ----------
+# Recently generated question lists keyed by (collection, n). Generation is
+# the most expensive call in the app, and clients routinely re-request the
+# same collection within a session; a fresh list is one TTL away (or one
+# /generate-questions/stream call, which always generates anew).
+QUESTIONS_TTL_SECONDS = 3600
+QUESTIONS_CACHE_MAX = 128
+_questions_cache = {}
+
+
+def _drop_cached_questions(collection_name: str) -> None:
+    """Forget cached questions for a collection (called on re-index)."""
+    for key in [k for k in _questions_cache if k[0] == collection_name]:
+        del _questions_cache[key]
+
+
+def _prune_questions_cache() -> None:
+    """Drop expired entries, then oldest-first down to the size cap."""
+    now = time.monotonic()
+    for key in [k for k, v in _questions_cache.items() if now - v[0] >= QUESTIONS_TTL_SECONDS]:
+        del _questions_cache[key]
+    while len(_questions_cache) > QUESTIONS_CACHE_MAX:
+        del _questions_cache[min(_questions_cache, key=lambda k: _questions_cache[k][0])]
+
+
 @app.post("/generate-questions", response_model=QuestionsResponse)
 async def generate_questions(request: QuestionRequest):
     """Generate study questions based on a collection"""
@@ -151,15 +209,23 @@ async def generate_questions(request: QuestionRequest):
             detail="Services not initialized"
         )
     
-    if not os.getenv("OPENAI_API_KEY"):
+    if not OPENAI_CONFIGURED:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
             detail="OpenAI API key not configured"
         )
     
+    cache_key = (request.collection_name, request.num_questions)
+    cached = _questions_cache.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < QUESTIONS_TTL_SECONDS:
+        return QuestionsResponse(questions=cached[1], collection_name=request.collection_name)
+
     try:
-        vectorstore = pdf_service.load_vectorstore(request.collection_name)
-        questions = question_service.generate_questions(vectorstore, request.num_questions)
+        vectorstore = await run_in_threadpool(pdf_service.load_vectorstore, request.collection_name)
+        questions = await question_service.agenerate_questions(vectorstore, request.num_questions)
+        _questions_cache[cache_key] = (time.monotonic(), questions)
+        if len(_questions_cache) > QUESTIONS_CACHE_MAX:
+            _prune_questions_cache()
         return QuestionsResponse(questions=questions, collection_name=request.collection_name)
     except FileNotFoundError:
         raise HTTPException(
@@ -172,6 +238,39 @@ async def generate_questions(request: QuestionRequest):
             detail=f"Failed to generate questions: {str(e)}"
         )
 
+@app.post("/generate-questions/stream")
+async def generate_questions_stream(request: QuestionRequest):
+    """Stream generated questions as newline-delimited JSON.
+
+    Questions are emitted as soon as the model finishes each one, so
+    clients can render incrementally instead of waiting for the full list.
+    """
+    if not question_service or not pdf_service:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Services not initialized"
+        )
+
+    if not OPENAI_CONFIGURED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OpenAI API key not configured"
+        )
+
+    try:
+        vectorstore = await run_in_threadpool(pdf_service.load_vectorstore, request.collection_name)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Collection '{request.collection_name}' not found"
+        )
+
+    async def question_stream():
+        async for question in question_service.astream_questions(vectorstore, request.num_questions):
+            yield orjson.dumps({"question": question}) + b"\n"
+
+    return StreamingResponse(question_stream(), media_type="application/x-ndjson")
+
 # ---------- Answer Evaluation ----------
 @app.post("/evaluate-answers", response_model=List[EvaluationResult])
 async def evaluate_answers(request: EvaluationRequest):
@@ -182,27 +281,23 @@ async def evaluate_answers(request: EvaluationRequest):
             detail="Services not initialized"
         )
     
-    if not os.getenv("OPENAI_API_KEY"):
+    if not OPENAI_CONFIGURED:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
             detail="OpenAI API key not configured"
         )
     
     try:
-        vectorstore = pdf_service.load_vectorstore(request.collection_name)
+        vectorstore = await run_in_threadpool(pdf_service.load_vectorstore, request.collection_name)
         qas = [(ans.question, ans.answer) for ans in request.answers]
-        results = evaluation_service.evaluate_answers(vectorstore, qas)
+        # Grade natively on the event loop; the sync wrapper would park a
+        # worker thread for the whole batch.
+        results = await evaluation_service.aevaluate_answers(vectorstore, qas)
         
-        return [
-            EvaluationResult(
-                question=r["question"],
-                answer=r["answer"],
-                ideal_answer=r["ideal_answer"],
-                score=r["score"],
-                reasoning=r["reasoning"]
-            )
-            for r in results
-        ]
+        # The service already returns dicts in the EvaluationResult shape;
+        # returning a Response directly skips FastAPI's second validation
+        # pass over the batch (response_model stays for the OpenAPI docs).
+        return ORJSONResponse(results)
     except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -217,14 +312,14 @@ async def evaluate_answers(request: EvaluationRequest):
 # ---------- Error Handlers ----------
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"error": exc.detail, "status_code": exc.status_code}
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc: Exception):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"error": "Internal server error", "detail": str(exc)}
     )
@@ -2,10 +2,12 @@ import os
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, UploadFile, File, status, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from typing import List, Dict, Any
 import tempfile
-import shutil
+import aiofiles
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -22,14 +24,15 @@ from models import (
 from security import (
     verify_api_key, limiter, security_headers_middleware, 
     check_file_size, validate_file_content, usage_tracker,
-    log_security_event, api_key_manager
+    log_security_event, api_key_manager, APIKeyMiddleware
 )
 
 # ---------- Setup ----------
 app = FastAPI(
     title="PDF Tutor API (Secured)",
     description="Secure API for PDF-based learning and evaluation system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,  # orjson serializes 2-5x faster than stdlib json
 )
 
 # Add security headers middleware
@@ -39,6 +42,11 @@ app.middleware("http")(security_headers_middleware)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Early API-key gate: unauthenticated requests to protected paths get a 401
+# from pure ASGI code before routing or dependency injection runs. Added
+# before CORS so preflight requests are still answered by CORSMiddleware.
+app.add_middleware(APIKeyMiddleware)
+
 # CORS middleware with restricted origins for production
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:8501,http://127.0.0.1:8501").split(",")
 
@@ -50,6 +58,10 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type", "X-API-Key"],
 )
 
+# Question/evaluation payloads are mostly long English text that compresses
+# 5-10x; skip small responses where the gzip header isn't worth it.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # ---------- Paths ----------
 APP_DIR = Path(__file__).parent
 DB_DIR = APP_DIR / "vectorstores"
@@ -58,7 +70,9 @@ UPLOAD_DIR = APP_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 # ---------- Initialize Services ----------
-if not os.getenv("OPENAI_API_KEY"):
+# The key is static per process; read it once instead of on every request.
+OPENAI_CONFIGURED = bool(os.getenv("OPENAI_API_KEY"))
+if not OPENAI_CONFIGURED:
     print("Warning: OPENAI_API_KEY not set. API will fail without it.")
 
 try:
@@ -67,7 +81,8 @@ try:
     
     pdf_service = PDFService(DB_DIR, embeddings)
     question_service = QuestionService(llm)
-    evaluation_service = EvaluationService(llm)
+    # Defaults to gpt-4o-mini; grading doesn't need the large model.
+    evaluation_service = EvaluationService()
 except Exception as e:
     print(f"Warning: Failed to initialize AI services: {e}")
     pdf_service = question_service = evaluation_service = None
@@ -82,7 +97,7 @@ async def root():
 async def health_check(request: Request):
     return HealthResponse(
         status="healthy",
-        openai_configured=bool(os.getenv("OPENAI_API_KEY")),
+        openai_configured=OPENAI_CONFIGURED,
         services_initialized=all([pdf_service, question_service, evaluation_service])
     )
 
@@ -110,25 +125,26 @@ async def upload_pdf(
             detail="Only PDF files are allowed"
         )
     
-    # Read file content for validation
-    file_content = await file.read()
-    await file.seek(0)  # Reset file pointer
-    
-    # Check file size (50MB limit)
-    check_file_size(len(file_content), 50)
-    
-    # Validate file content
-    if not validate_file_content(file_content):
+    # The PDF signature sits in the first 5 bytes; validate those, then
+    # stream the rest to disk in 1MB chunks. Peak memory stays constant
+    # instead of one full PDF per concurrent upload, the 50MB limit is
+    # enforced as bytes arrive, and the event loop runs between chunks.
+    header = await file.read(5)
+    if not validate_file_content(header):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid PDF file format"
         )
     
-    # Save uploaded file
     file_path = UPLOAD_DIR / file.filename
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        total_size = len(header)
+        async with aiofiles.open(file_path, "wb") as buffer:
+            await buffer.write(header)
+            while chunk := await file.read(1 << 20):
+                total_size += len(chunk)
+                check_file_size(total_size, 50)
+                await buffer.write(chunk)
         
         # Track usage
         usage_tracker.track_request(api_key_info["name"], "upload_pdf", cost=5)
@@ -138,6 +154,10 @@ async def upload_pdf(
             filename=file.filename,
             suggested_collection_name=file.filename.rsplit(".pdf", 1)[0]
         )
+    except HTTPException:
+        # Oversized upload: don't leave the truncated file behind.
+        file_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
         log_security_event("upload_error", {
             "api_key": api_key_info["name"],
@@ -171,7 +191,8 @@ async def index_pdf(
         )
     
     try:
-        message = pdf_service.index_pdf(file_path, request.collection_name)
+        # index_pdf is CPU/GIL-heavy for seconds; keep the event loop free
+        message = await run_in_threadpool(pdf_service.index_pdf, file_path, request.collection_name)
         
         # Track usage (indexing is expensive)
         usage_tracker.track_request(api_key_info["name"], "index_pdf", cost=10)
@@ -224,15 +245,15 @@ async def generate_questions(
             detail="Services not initialized"
         )
     
-    if not os.getenv("OPENAI_API_KEY"):
+    if not OPENAI_CONFIGURED:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="OpenAI API key not configured"
         )
     
     try:
-        vectorstore = pdf_service.load_vectorstore(request.collection_name)
-        questions = question_service.generate_questions(vectorstore, request.num_questions)
+        vectorstore = await run_in_threadpool(pdf_service.load_vectorstore, request.collection_name)
+        questions = await question_service.agenerate_questions(vectorstore, request.num_questions)
         
         # Track usage (AI calls are expensive)
         usage_tracker.track_request(api_key_info["name"], "generate_questions", cost=request.num_questions)
@@ -268,16 +289,18 @@ async def evaluate_answers(
             detail="Services not initialized"
         )
     
-    if not os.getenv("OPENAI_API_KEY"):
+    if not OPENAI_CONFIGURED:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="OpenAI API key not configured"
         )
     
     try:
-        vectorstore = pdf_service.load_vectorstore(request.collection_name)
+        vectorstore = await run_in_threadpool(pdf_service.load_vectorstore, request.collection_name)
         qas = [(ans.question, ans.answer) for ans in request.answers]
-        results = evaluation_service.evaluate_answers(vectorstore, qas)
+        # Grade natively on the event loop; the sync wrapper would park a
+        # worker thread for the whole batch.
+        results = await evaluation_service.aevaluate_answers(vectorstore, qas)
         
         # Track usage (most expensive operation)
         usage_tracker.track_request(api_key_info["name"], "evaluate_answers", cost=len(request.answers) * 3)
@@ -288,16 +311,10 @@ async def evaluate_answers(
             "num_answers": len(request.answers)
         })
         
-        return [
-            EvaluationResult(
-                question=r["question"],
-                answer=r["answer"],
-                ideal_answer=r["ideal_answer"],
-                score=r["score"],
-                reasoning=r["reasoning"]
-            )
-            for r in results
-        ]
+        # The service already returns dicts in the EvaluationResult shape;
+        # returning a Response directly skips FastAPI's second validation
+        # pass over the batch (response_model stays for the OpenAPI docs).
+        return ORJSONResponse(results)
     except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -334,7 +351,7 @@ async def generate_new_api_key(
 # ---------- Error Handlers ----------
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"error": exc.detail, "status_code": exc.status_code}
     )
@@ -346,7 +363,7 @@ async def general_exception_handler(request, exc: Exception):
         "path": str(request.url.path),
         "method": request.method
     })
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"error": "Internal server error", "detail": str(exc)}
     )
@@ -5,6 +5,7 @@ import os
 import time
 import hashlib
 import secrets
+from types import MappingProxyType
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 
@@ -54,8 +55,21 @@ security = HTTPBearer(auto_error=False)
 
 # ---------- API Key Management ----------
 class APIKeyManager:
+    """Holds the API key table.
+
+    The table is read-mostly: validation happens on every authenticated
+    request, while keys are only added at startup or through generate_key.
+    Membership is checked against a frozenset and the info dicts are
+    exposed through a read-only view, so the hot path never writes shared
+    state; usage counts go through Redis (with a local fallback counter)
+    instead of mutating the table.
+    """
+
     def __init__(self):
-        self.api_keys = self._load_api_keys()
+        self._keys = self._load_api_keys()
+        self.api_keys = MappingProxyType(self._keys)
+        self._valid_keys = frozenset(self._keys)
+        self._fallback_counts = {}
     
     def _load_api_keys(self) -> Dict[str, Dict[str, Any]]:
         """Load API keys from environment or database"""
@@ -88,20 +102,30 @@ class APIKeyManager:
     
     def validate_key(self, api_key: str) -> Optional[Dict[str, Any]]:
         """Validate API key and return key info"""
-        if api_key in self.api_keys:
-            self.api_keys[api_key]["usage_count"] += 1
-            return self.api_keys[api_key]
-        return None
+        if api_key not in self._valid_keys:
+            return None
+        # Count usage in Redis where possible: HINCRBY is atomic and shared
+        # across gunicorn workers, unlike this process's dict.
+        if redis_client is not None:
+            try:
+                redis_client.hincrby(f"key:{api_key}", "usage_count", 1)
+                return self._keys[api_key]
+            except Exception:
+                pass
+        self._fallback_counts[api_key] = self._fallback_counts.get(api_key, 0) + 1
+        return self._keys[api_key]
     
     def generate_key(self, name: str) -> str:
         """Generate new API key"""
         key = f"{API_KEY_PREFIX}{secrets.token_urlsafe(32)}"
-        self.api_keys[key] = {
+        self._keys[key] = {
             "name": name,
             "created_at": datetime.now(),
             "usage_count": 0,
             "rate_limit": "50/hour"
         }
+        # Rebuild the frozen membership set; the proxy view tracks _keys.
+        self._valid_keys = frozenset(self._keys)
         return key
 
 
@@ -149,6 +173,12 @@ def get_api_key(request: Request) -> Optional[str]:
 
 def verify_api_key(request: Request) -> Dict[str, Any]:
     """Verify API key dependency"""
+    # APIKeyMiddleware already validated the key on its way in; reuse its
+    # result instead of validating (and counting) the key twice.
+    key_info = getattr(request.state, "api_key_info", None)
+    if key_info is not None:
+        return key_info
+
     api_key = get_api_key(request)
     
     if not api_key:
@@ -186,6 +216,70 @@ def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(securit
 
 
 # ---------- Security Middleware ----------
+# Paths reachable without an API key (health checks and the docs UI).
+_PUBLIC_PATHS = {"/", "/health", "/docs", "/redoc", "/openapi.json"}
+
+
+class APIKeyMiddleware:
+    """Reject unauthenticated requests before FastAPI routing runs.
+
+    Pure ASGI: the key is read straight out of the scope headers and
+    validated with one dict lookup, so a missing or invalid key costs a
+    short-circuit 401 instead of routing, dependency resolution and
+    endpoint setup. Valid key info is stashed on the request state, where
+    verify_api_key picks it up without re-validating.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] in _PUBLIC_PATHS
+            or scope["method"] == "OPTIONS"  # CORS preflight carries no key
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        api_key = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                api_key = value.decode("latin-1")
+                break
+        if api_key is None:
+            # Query parameter fallback, matching get_api_key (less secure).
+            for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+                if part.startswith("api_key="):
+                    api_key = part[len("api_key="):]
+                    break
+
+        key_info = api_key_manager.validate_key(api_key) if api_key else None
+        if key_info is None:
+            body = b'{"error":"Invalid or missing API key","status_code":401}'
+            # This middleware sits outside security_headers_middleware
+            # (add_middleware wraps later registrations around earlier
+            # ones), so the short-circuit has to carry the same security
+            # headers itself.
+            await send({
+                "type": "http.response.start",
+                "status": status.HTTP_401_UNAUTHORIZED,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-content-type-options", b"nosniff"),
+                    (b"x-frame-options", b"DENY"),
+                    (b"x-xss-protection", b"1; mode=block"),
+                    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        scope.setdefault("state", {})["api_key_info"] = key_info
+        await self.app(scope, receive, send)
+
+
 async def security_headers_middleware(request: Request, call_next):
     """Add security headers to responses"""
     response = await call_next(request)
@@ -210,7 +304,11 @@ def check_file_size(file_size: int, max_size_mb: int = 50):
 
 
 def validate_file_content(file_content: bytes) -> bool:
-    """Validate that file is actually a PDF"""
+    """Validate that file is actually a PDF.
+
+    Only the first 5 bytes are inspected, so callers streaming an upload
+    can pass just the header instead of buffering the whole file.
+    """
     # Check PDF magic bytes
     pdf_signature = b'%PDF-'
     return file_content.startswith(pdf_signature)
@@ -218,11 +316,32 @@ def validate_file_content(file_content: bytes) -> bool:
 
 # ---------- Usage Tracking ----------
 class UsageTracker:
+    """Track API usage per key.
+
+    Counters live in a Redis hash when Redis is reachable: HINCRBY is
+    atomic and shared, so totals stay correct across gunicorn workers
+    instead of each process accumulating its own copy. The previous
+    in-process dict remains as the fallback.
+    """
+
     def __init__(self):
         self.usage = {}
-    
+
     def track_request(self, api_key: str, endpoint: str, cost: int = 1):
         """Track API usage"""
+        if redis_client is not None:
+            try:
+                now = datetime.now().isoformat()
+                pipe = redis_client.pipeline()
+                pipe.hincrby(f"usage:{api_key}", "total_requests", cost)
+                pipe.hincrby(f"usage:{api_key}", f"endpoint:{endpoint}", cost)
+                pipe.hsetnx(f"usage:{api_key}", "first_request", now)
+                pipe.hset(f"usage:{api_key}", "last_request", now)
+                pipe.execute()
+                return
+            except Exception:
+                pass  # Redis went away; fall through to the local dict
+
         if api_key not in self.usage:
             self.usage[api_key] = {
                 "total_requests": 0,
@@ -230,16 +349,32 @@ class UsageTracker:
                 "first_request": datetime.now(),
                 "last_request": datetime.now()
             }
-        
+
         self.usage[api_key]["total_requests"] += cost
         self.usage[api_key]["last_request"] = datetime.now()
-        
+
         if endpoint not in self.usage[api_key]["endpoints"]:
             self.usage[api_key]["endpoints"][endpoint] = 0
         self.usage[api_key]["endpoints"][endpoint] += cost
-    
+
     def get_usage(self, api_key: str) -> Dict[str, Any]:
         """Get usage statistics for API key"""
+        if redis_client is not None:
+            try:
+                data = redis_client.hgetall(f"usage:{api_key}")
+            except Exception:
+                data = None
+            if data:
+                return {
+                    "total_requests": int(data.get("total_requests", 0)),
+                    "endpoints": {
+                        field[len("endpoint:"):]: int(count)
+                        for field, count in data.items()
+                        if field.startswith("endpoint:")
+                    },
+                    "first_request": data.get("first_request"),
+                    "last_request": data.get("last_request"),
+                }
         return self.usage.get(api_key, {})
 
 
@@ -284,9 +419,64 @@ def get_rate_limit_key(request: Request, api_key: str = None) -> str:
     return f"ip:{get_remote_address(request)}"
 
 
+# Token bucket in a single Lua EVAL so refill-and-take is atomic even with
+# many workers hitting the same key. KEYS[1] holds (tokens, last_refill);
+# ARGV = capacity, refill rate per second, now. Returns 1 to allow.
+_TOKEN_BUCKET_LUA = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last_refill')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'last_refill', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+return allowed
+"""
+
+# Fallback buckets when Redis is unavailable: key -> [tokens, last_refill].
+_local_buckets: Dict[str, list] = {}
+
+_PERIOD_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
 def check_rate_limit(request: Request, api_key: str = None, limit: str = "10/minute"):
-    """Check if request exceeds rate limit"""
+    """Check the request against a token bucket; raise 429 when exhausted.
+
+    The bucket refills continuously (capacity/period per second) so bursts
+    up to the full limit are allowed but the sustained rate is enforced.
+    """
     key = get_rate_limit_key(request, api_key)
-    # Implementation would depend on chosen rate limiting library
-    # This is a placeholder for the concept
-    pass
\ No newline at end of file
+    count, period = limit.split("/")
+    capacity = int(count)
+    rate = capacity / _PERIOD_SECONDS[period]
+    now = time.time()
+
+    if redis_client is not None:
+        try:
+            allowed = redis_client.eval(_TOKEN_BUCKET_LUA, 1, f"bucket:{key}", capacity, rate, now)
+        except Exception:
+            allowed = None
+        if allowed is not None:
+            if not int(allowed):
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Rate limit exceeded: {limit}"
+                )
+            return
+
+    tokens, last = _local_buckets.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - last) * rate)
+    if tokens < 1:
+        _local_buckets[key] = [tokens, now]
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded: {limit}"
+        )
+    _local_buckets[key] = [tokens - 1, now]
\ No newline at end of file
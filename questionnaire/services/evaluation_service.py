@@ -1,31 +1,50 @@
+import asyncio
 import re
-import json
+import orjson
+import numpy as np
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.vectorstores import FAISS
 
+from services.llm_cache import LLMCache
+from services.pdf_service import _run_async
+from services.rate_limit import openai_limiter
+
+# Cap on concurrent question evaluations, to stay within OpenAI rate limits.
+EVAL_CONCURRENCY = 10
+
+# Chunks retrieved per question.
+CONTEXT_K = 6
+
+# Strips markdown code fences around model JSON output; compiled once instead
+# of on every evaluation.
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE | re.MULTILINE)
+
 
 class EvaluationService:
     def __init__(self, llm: ChatOpenAI = None):
-        self.llm = llm or ChatOpenAI(model="gpt-4o", temperature=0)
-        self.rag_answer_prompt = ChatPromptTemplate.from_messages([
+        # Grading short student answers against retrieved context is well
+        # within gpt-4o-mini's capability at ~10x lower cost and faster
+        # tokens; question generation stays on the larger model.
+        self.llm = llm or ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        # OpenAI JSON mode guarantees the grader returns a bare JSON object,
+        # so _extract_json's fence stripping is only a safety net.
+        self.json_llm = self.llm.bind(response_format={"type": "json_object"})
+        # Grading at temperature 0 is deterministic, so identical
+        # (question, answer, context) submissions reuse the stored response.
+        self.cache = LLMCache(namespace="llm:grade")
+        # A single prompt produces both the ideal answer and the grade, so
+        # each question costs one LLM round-trip (and one prefill of the
+        # shared context) instead of two.
+        self.grading_prompt = ChatPromptTemplate.from_messages([
             ("system", """
-Using ONLY the provided context, write a concise, high-quality ideal answer to the question.
-If the context is insufficient, say so and answer partially.
-Context:
----
-{context}
----
-Question: {question}
-Return only the answer text.
-"""),
-        ])
-        
-        self.eval_prompt = ChatPromptTemplate.from_messages([
-            ("system", """
-You are a strict but fair grader. Use ONLY the provided context to evaluate the student's answer.
+You are a strict but fair tutor. Use ONLY the provided context.
+First write a concise, high-quality ideal answer to the question; if the
+context is insufficient, say so and answer partially. Then grade the
+student's answer against the context.
 Return ONE JSON object with exactly these keys:
+- ideal_answer: string (the ideal answer text)
 - score: integer in [1,10]
 - reasoning: string (1-3 sentences)
 No markdown, no code fences, no extra text.
@@ -38,53 +57,126 @@ Reference context:
 Return JSON now.
 """),
         ])
-    
+        # The prompt text is part of the cache key: an edit to the rubric or
+        # the output keys must miss, not keep serving grades produced under
+        # the old prompt for the rest of the TTL (shared via Redis across
+        # workers and deploys).
+        self._prompt_text = "".join(
+            m.prompt.template for m in self.grading_prompt.messages
+        )
+
     def _extract_json(self, s: str) -> dict:
         """Extract JSON from model response."""
         s = s.strip()
-        s = re.sub(r"^```(?:json)?\\s*|```$", "", s, flags=re.IGNORECASE|re.MULTILINE).strip()
-        if "{" in s and "}" in s:
-            s = s[s.find("{"): s.rfind("}")+1]
+        # Common case: slice between the outermost braces and parse directly;
+        # any code fences fall outside the slice, so no regex runs at all.
+        i, j = s.find("{"), s.rfind("}")
+        if 0 <= i < j:
+            try:
+                return orjson.loads(s[i:j + 1])
+            except Exception:
+                pass
+        s = _JSON_FENCE_RE.sub("", s).strip()
         try:
-            return json.loads(s)
+            return orjson.loads(s)
         except Exception:
             return {"score": None, "reasoning": s}
     
-    def evaluate_answers(self, vectorstore: FAISS, qas: list):
-        """Evaluate student answers against ideal answers from context."""
-        results = []
-        for q, a in qas:
-            retriever = vectorstore.as_retriever(search_kwargs={"k": 6})
-            docs = retriever.get_relevant_documents(q)
-            context = "\n\n".join(d.page_content for d in docs)
-            
-            # Generate ideal answer from context
-            ideal = (self.rag_answer_prompt | self.llm | StrOutputParser()).invoke({
-                "question": q, 
-                "context": context
-            }).strip()
-            
-            # Grade strictly as JSON
-            raw = (self.eval_prompt | self.llm | StrOutputParser()).invoke({
-                "question": q,
-                "answer": a or "",
-                "context": context,
-            })
-            
+    async def _aretrieve_contexts(self, vectorstore: FAISS, questions: list, k: int = 6) -> list:
+        """Retrieve docs for all questions with one embedding round-trip.
+
+        Embeds every question in a single OpenAI request and runs one batched
+        FAISS matrix search, instead of N embedding calls and N single-vector
+        searches through the retriever.
+        """
+        embedder = vectorstore.embeddings
+        if embedder is not None:
+            await openai_limiter.acquire(
+                sum(openai_limiter.estimate_tokens(q) for q in questions)
+            )
+            qvecs = await embedder.aembed_documents(questions)
+            _, indices = vectorstore.index.search(np.asarray(qvecs, dtype="float32"), k)
+            return [
+                [
+                    vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                    for i in row if i != -1
+                ]
+                for row in indices
+            ]
+        # No embedding object attached to the store; fall back to per-question
+        # retrieval (still concurrent).
+        retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+        return list(await asyncio.gather(*(retriever.ainvoke(q) for q in questions)))
+
+    async def aevaluate_answers(self, vectorstore: FAISS, qas: list):
+        """Evaluate student answers against ideal answers from context.
+
+        Questions are scored concurrently, and each question needs a single
+        fused LLM call that returns the ideal answer and the grade together,
+        so wall time is roughly one round-trip regardless of N.
+        """
+        grading_chain = self.grading_prompt | self.json_llm | StrOutputParser()
+        semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+        # Repeated (question, answer) pairs grade identically at
+        # temperature 0; retrieve and grade each distinct pair once, then
+        # fan the results back out in submission order.
+        unique_qas = list(dict.fromkeys((q, a) for q, a in qas))
+
+        docs_per_question = await self._aretrieve_contexts(
+            vectorstore, [q for q, _ in unique_qas], k=CONTEXT_K
+        )
+
+        def join_context(docs):
+            # Overlapping chunks can retrieve identical text; dedupe before
+            # paying for it twice on the OpenAI wire.
+            return "\n\n".join(dict.fromkeys(d.page_content for d in docs))
+
+        contexts = [join_context(docs) for docs in docs_per_question]
+
+        async def score_one(q, a, context):
+            cache_key = LLMCache.key(
+                self._prompt_text,
+                getattr(self.llm, "model_name", ""),
+                getattr(self.llm, "temperature", ""),
+                q, a or "", context,
+            )
+            raw = self.cache.get(cache_key)
+            if raw is None:
+                async with semaphore:
+                    await openai_limiter.acquire(
+                        openai_limiter.estimate_tokens(q + (a or "") + context)
+                    )
+                    raw = await grading_chain.ainvoke({
+                        "question": q,
+                        "answer": a or "",
+                        "context": context,
+                    })
+                self.cache.put(cache_key, raw)
+
             parsed = self._extract_json(raw)
             try:
                 score_val = int(round(float(parsed.get("score", 0))))
             except Exception:
                 score_val = None
-                
+
             if isinstance(score_val, int):
                 score_val = max(1, min(10, score_val))
-                
-            results.append({
+
+            return {
                 "question": q,
                 "answer": a,
-                "ideal_answer": ideal,
+                "ideal_answer": (parsed.get("ideal_answer") or "").strip(),
                 "score": score_val,
                 "reasoning": parsed.get("reasoning"),
-            })
-        return results
\ No newline at end of file
+            }
+
+        scored = await asyncio.gather(
+            *(score_one(q, a, context) for (q, a), context in zip(unique_qas, contexts))
+        )
+        by_pair = dict(zip(unique_qas, scored))
+        return [by_pair[(q, a)] for q, a in qas]
+
+    def evaluate_answers(self, vectorstore: FAISS, qas: list):
+        """Synchronous wrapper around aevaluate_answers for existing callers."""
+        return _run_async(self.aevaluate_answers(vectorstore, qas))
\ No newline at end of file
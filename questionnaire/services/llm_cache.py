@@ -0,0 +1,77 @@
+"""Content-addressed cache for deterministic LLM calls."""
+import hashlib
+import os
+
+try:
+    import redis
+    HAS_REDIS = True
+except Exception:
+    HAS_REDIS = False
+
+# Grading prompts and context rarely change within a week; after that the
+# entries are cheap to rebuild anyway.
+TTL_SECONDS = 7 * 24 * 3600
+
+
+class LLMCache:
+    """Cache LLM responses keyed by a hash of the full request content.
+
+    Grading runs at temperature 0, so for a fixed model, prompt, context,
+    question and answer the response is deterministic — re-evaluating the
+    same submission (page reloads, retries, repeated metric runs) can skip
+    the network entirely. Backed by Redis when one is reachable so all
+    workers share hits; falls back to a per-process dict otherwise.
+
+    Modes via the LLM_CACHE env var: "on" (default), "off", and "replay",
+    which raises on a miss so offline evaluation runs are guaranteed never
+    to touch the API.
+    """
+
+    def __init__(self, namespace: str = "llm"):
+        self.namespace = namespace
+        self.mode = os.getenv("LLM_CACHE", "on").lower()
+        self._local = {}
+        self._redis = None
+        if HAS_REDIS:
+            try:
+                client = redis.Redis(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", 6379)),
+                    decode_responses=True,
+                )
+                client.ping()
+                self._redis = client
+            except Exception:
+                self._redis = None
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Hash the request content into a fixed-size cache key."""
+        return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+    def get(self, key: str):
+        if self.mode == "off":
+            return None
+        full_key = f"{self.namespace}:{key}"
+        if self._redis is not None:
+            try:
+                value = self._redis.get(full_key)
+            except Exception:
+                value = self._local.get(full_key)
+        else:
+            value = self._local.get(full_key)
+        if value is None and self.mode == "replay":
+            raise KeyError(f"LLM cache miss in replay mode: {full_key}")
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        if self.mode == "off":
+            return
+        full_key = f"{self.namespace}:{key}"
+        if self._redis is not None:
+            try:
+                self._redis.setex(full_key, TTL_SECONDS, value)
+                return
+            except Exception:
+                pass
+        self._local[full_key] = value
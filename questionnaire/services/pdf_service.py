@@ -1,5 +1,17 @@
+import asyncio
+import hashlib
+import math
 import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+import faiss
+import numpy as np
 from pypdf.errors import DependencyError as PdfDependencyError
 
 from langchain_community.document_loaders import PyPDFLoader
@@ -9,43 +21,178 @@ try:
 except Exception:
     HAS_PYMUPDF = False
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain.text_splitter import TokenTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 
+# Embedding is I/O-bound on OpenAI round-trips; batch chunks and embed the
+# batches concurrently instead of one serial embed_documents call.
+EMBED_BATCH_SIZE = 256
+EMBED_CONCURRENCY = 8
+
+# Collections below this size keep the exhaustive flat index; above it, an
+# IVF index trades a little recall for 10-100x cheaper queries.
+IVF_THRESHOLD = 2000
+
+# Loaded vector stores kept resident per process; beyond this the least
+# recently used store is dropped so many cold collections can't pin memory.
+VS_CACHE_MAX = 8
+
+
+def _run_async(coro):
+    """Run a coroutine to completion whether or not an event loop is running."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside a running loop (e.g. a FastAPI endpoint); run the
+    # coroutine in a fresh loop on a worker thread instead.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
 
 class PDFService:
     def __init__(self, db_dir: Path, embeddings: OpenAIEmbeddings = None):
         self.db_dir = db_dir
         self.db_dir.mkdir(parents=True, exist_ok=True)
-        self.embeddings = embeddings or OpenAIEmbeddings()
+        base_embeddings = embeddings or OpenAIEmbeddings()
+        # Embeddings are deterministic and billed per token; cache them by
+        # content hash so re-indexing a tweaked PDF only embeds the chunks
+        # that actually changed.
+        self.embeddings = CacheBackedEmbeddings.from_bytes_store(
+            base_embeddings,
+            LocalFileStore(str(self.db_dir / ".emb_cache")),
+            namespace=getattr(base_embeddings, "model", "embeddings"),
+            # Retrieval queries draw from a small fixed pool, so cache those too.
+            query_embedding_cache=True,
+        )
+        # Token-based splitting runs on tiktoken's Rust BPE in a single pass,
+        # unlike the pure-Python recursive character splitter whose repeated
+        # scans dominated indexing time on large PDFs. 300/30 tokens roughly
+        # matches the old 1200/120 character chunking. Built once and reused.
+        self.splitter = TokenTextSplitter(
+            encoding_name="cl100k_base", chunk_size=300, chunk_overlap=30
+        )
+        # Deserialized FAISS stores, keyed by collection name, LRU-evicted at
+        # VS_CACHE_MAX entries. Entries carry the index file's mtime so a
+        # re-index invalidates the cached store.
+        self._vs_cache = OrderedDict()
+        self._vs_cache_lock = threading.Lock()
+        # (db_dir mtime_ns, names) pair; adding/removing a collection touches
+        # the directory mtime, so it doubles as the invalidation key.
+        self._collections_cache = None
     
     def _load_pdf_docs(self, abs_path: Path):
-        """Load PDF documents with fallback to PyMuPDF if needed."""
+        """Load PDF documents, preferring PyMuPDF with fallback to pypdf.
+
+        PyMuPDF's C-backed text extraction is an order of magnitude faster
+        than pure-Python pypdf on large documents, so use it whenever it is
+        installed and keep pypdf as the fallback.
+        """
+        if HAS_PYMUPDF:
+            try:
+                return PyMuPDFLoader(str(abs_path)).load()
+            except Exception:
+                return PyPDFLoader(str(abs_path)).load()
         try:
             return PyPDFLoader(str(abs_path)).load()
         except PdfDependencyError:
-            if HAS_PYMUPDF:
-                return PyMuPDFLoader(str(abs_path)).load()
-            else:
-                raise Exception("This PDF appears to use AES encryption. Install 'cryptography' or 'pymupdf'.")
-        except Exception as e:
-            if HAS_PYMUPDF:
-                return PyMuPDFLoader(str(abs_path)).load()
-            raise
+            raise Exception("This PDF appears to use AES encryption. Install 'cryptography' or 'pymupdf'.")
     
+    def _embed_texts(self, texts: list) -> list:
+        """Embed texts in concurrent batches to overlap OpenAI round-trips."""
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+
+        async def embed_all():
+            semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+            async def embed_batch(batch):
+                async with semaphore:
+                    return await self.embeddings.aembed_documents(batch)
+
+            results = await asyncio.gather(*(embed_batch(b) for b in batches))
+            return [vector for batch_vectors in results for vector in batch_vectors]
+
+        return _run_async(embed_all())
+
+    @staticmethod
+    def _content_hash(abs_path: Path) -> str:
+        """Hash the PDF bytes (blake2b, streamed in 1MB chunks)."""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(abs_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _build_ivf_index(vectors: list) -> "faiss.Index":
+        """Build an IVF index over the embedding matrix.
+
+        The default IndexFlatL2 scans every vector on each query; for large
+        collections an inverted-file index only probes a few clusters.
+        Vectors are stored as fp16 scalar-quantized codes, halving the memory
+        traffic that dominates CPU search, at negligible recall cost for
+        1536-d OpenAI embeddings. Vector ids follow add order, so the flat
+        store's sequential index_to_docstore_id mapping still applies.
+        """
+        mat = np.asarray(vectors, dtype="float32")
+        d = mat.shape[1]
+        nlist = max(4, int(4 * math.sqrt(len(mat))))
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, d, nlist, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2
+        )
+        index.train(mat)
+        index.add(mat)
+        index.nprobe = max(1, nlist // 32)
+        return index
+
     def index_pdf(self, file_path: Path, collection_name: str) -> str:
         """Index a PDF file into a vector store collection."""
         abs_path = Path(str(file_path).strip().strip("'\" ")).resolve()
         if not abs_path.exists():
             raise FileNotFoundError(f"PDF file not found at {abs_path}")
 
+        # Re-indexing identical content just re-buys the same embeddings;
+        # skip when the stored content hash matches this PDF.
+        content_hash = self._content_hash(abs_path)
+        hash_file = self.db_dir / collection_name / ".content_hash"
+        if hash_file.exists() and hash_file.read_text().strip() == content_hash:
+            return (
+                f"Collection '{collection_name}' already contains '{abs_path.name}' "
+                f"(content unchanged); skipped re-indexing"
+            )
+
         docs = self._load_pdf_docs(abs_path)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=120)
-        chunks = splitter.split_documents(docs)
+        chunks = self.splitter.split_documents(docs)
 
-        vs = FAISS.from_documents(chunks, embedding=self.embeddings)
-        vs.save_local(str(self.db_dir / collection_name))
+        texts = [c.page_content for c in chunks]
+        metadatas = [c.metadata for c in chunks]
+        vectors = self._embed_texts(texts)
+        vs = FAISS.from_embeddings(
+            list(zip(texts, vectors)),
+            embedding=self.embeddings,
+            metadatas=metadatas,
+        )
+        if len(texts) >= IVF_THRESHOLD:
+            vs.index = self._build_ivf_index(vectors)
+        # save_local rewrites index.faiss in place, which tears the
+        # read-only mappings _read_vectorstore hands out: a cached store
+        # searching mid-rewrite reads garbage or dies on SIGBUS. Save to a
+        # scratch dir and os.replace the files into place so the old inodes
+        # stay valid for any open mapping until its store is dropped.
+        store_dir = self.db_dir / collection_name
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.db_dir, prefix=f".{collection_name}-"))
+        try:
+            vs.save_local(str(tmp_dir))
+            store_dir.mkdir(parents=True, exist_ok=True)
+            for name in ("index.faiss", "index.pkl"):
+                os.replace(tmp_dir / name, store_dir / name)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        hash_file.write_text(content_hash)
 
         return f"Indexed '{abs_path.name}' into collection '{collection_name}' at {self.db_dir / collection_name}"
     
@@ -53,14 +200,70 @@ class PDFService:
         """List available vector store collections."""
         if not self.db_dir.exists():
             return []
-        return [
-            p.name for p in self.db_dir.iterdir() 
-            if p.is_dir() and ((p / "index.faiss").exists() or any(p.glob("*.faiss")))
+        mtime = self.db_dir.stat().st_mtime_ns
+        if self._collections_cache is not None and self._collections_cache[0] == mtime:
+            return self._collections_cache[1]
+        # Dot-prefixed dirs are internal (.emb_cache, in-flight save
+        # scratch dirs), never collections.
+        collections = [
+            p.name for p in self.db_dir.iterdir()
+            if p.is_dir() and not p.name.startswith(".") and (p / "index.faiss").exists()
         ]
+        self._collections_cache = (mtime, collections)
+        return collections
     
+    def _read_vectorstore(self, store_dir: Path) -> FAISS:
+        """Deserialize a saved store, memory-mapping the FAISS index.
+
+        faiss.read_index with IO_FLAG_MMAP maps the vector data instead of
+        copying it into RAM, so cold-start load cost stops scaling with index
+        size and several large collections can be served from limited memory.
+        Falls back to the standard load_local if mmap is unsupported for the
+        saved index type.
+        """
+        try:
+            index = faiss.read_index(
+                str(store_dir / "index.faiss"),
+                faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+            )
+            with open(store_dir / "index.pkl", "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            return FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id,
+            )
+        except Exception:
+            return FAISS.load_local(
+                str(store_dir), self.embeddings, allow_dangerous_deserialization=True
+            )
+
     def load_vectorstore(self, collection_name: str) -> FAISS:
-        """Load a vector store by collection name."""
+        """Load a vector store by collection name, caching per process.
+
+        Deserializing the FAISS index and docstore pickle costs hundreds of
+        milliseconds per request on a warm server; cache the loaded store and
+        invalidate on the index file's mtime.
+        """
         store_dir = self.db_dir / collection_name
         if not store_dir.exists():
             raise FileNotFoundError(f"No vector store for '{collection_name}'.")
-        return FAISS.load_local(str(store_dir), self.embeddings, allow_dangerous_deserialization=True)
\ No newline at end of file
+
+        index_file = store_dir / "index.faiss"
+        mtime = index_file.stat().st_mtime if index_file.exists() else None
+        with self._vs_cache_lock:
+            cached = self._vs_cache.get(collection_name)
+            if cached is not None and cached[0] == mtime:
+                self._vs_cache.move_to_end(collection_name)
+                return cached[1]
+
+        vs = self._read_vectorstore(store_dir)
+        if isinstance(vs.index, faiss.IndexIVF):
+            vs.index.nprobe = max(1, vs.index.nlist // 32)
+        with self._vs_cache_lock:
+            self._vs_cache[collection_name] = (mtime, vs)
+            self._vs_cache.move_to_end(collection_name)
+            while len(self._vs_cache) > VS_CACHE_MAX:
+                self._vs_cache.popitem(last=False)
+        return vs
\ No newline at end of file
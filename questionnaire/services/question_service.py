@@ -1,69 +1,75 @@
 import random
-import uuid
+import re
 from typing import List, Set
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except Exception:
+    HAS_TIKTOKEN = False
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.vectorstores import FAISS
 
+from services.pdf_service import _run_async
 
-class QuestionService:
-    def __init__(self, llm: ChatOpenAI = None):
-        # Use higher temperature for randomness
-        self.llm = llm or ChatOpenAI(model="gpt-4o", temperature=0.7)
-        
-        # Multiple prompt variations for diversity
-        self.question_prompts = [
-            """You are an expert educator creating study questions. Generate {n} unique, thought-provoking questions based on the provided content.
-Focus on {focus_area}. Mix difficulty levels from basic recall to analytical thinking.
-Create questions that encourage deep understanding rather than memorization.
+# Word-overlap Jaccard above this marks two questions as near-duplicates.
+_SIMILARITY_THRESHOLD = 0.7
 
-Content:
----
-{context}
----
-
-Generate exactly {n} distinct questions as a numbered list:""",
+# List numbering ("1.", "10)") or a bullet at the start of a line; one
+# compiled scan replaces the old 24-prefix startswith loop and handles any
+# one- or two-digit numbering.
+_PREFIX_RE = re.compile(r"^\s*(?:\d{1,2}[.)]|[-*•])\s*")
 
-            """As a skilled tutor, create {n} diverse study questions from the given material.
-Emphasize {focus_area} and ensure questions test different cognitive levels:
-- Some should test comprehension and recall
-- Others should require analysis and application
-- Include questions that connect concepts
+# One static system prompt, byte-identical across calls, so the prefix hits
+# OpenAI's automatic prompt cache; everything volatile (focus area, context,
+# n) rides in the trailing user message. Diversity comes from randomized
+# retrieval, not prompt wording. Built once at import, shared by instances.
+_QUESTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert educator creating study questions. Generate unique, thought-provoking questions based on the provided content.
+Mix difficulty levels from basic recall to analytical thinking, use varied question formats (what, how, why, compare, analyze), and ensure each question tests a different aspect of the material.
+Create questions that encourage deep understanding rather than memorization."""),
+    ("user", """Focus on {focus_area}.
 
-Material:
+Content:
 ---
 {context}
 ---
 
-Provide {n} unique questions in numbered format:""",
+Generate exactly {n} distinct questions as a numbered list:"""),
+])
 
-            """You are designing an assessment. Create {n} varied questions based on the content below.
-Prioritize {focus_area} and ensure each question:
-- Tests different aspects of the material
-- Uses varied question formats (what, how, why, compare, analyze)
-- Ranges from introductory to advanced difficulty
+# Shared default model, built on first use. ChatOpenAI construction parses
+# env config and sets up an httpx connection pool; one instance amortizes
+# that (and its pool) across every QuestionService created without an llm.
+_default_llm = None
 
-Source content:
----
-{context}
----
 
-Generate {n} distinct study questions:""",
+def _get_default_llm() -> ChatOpenAI:
+    global _default_llm
+    if _default_llm is None:
+        # Higher temperature for randomness
+        _default_llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+    return _default_llm
 
-            """Create {n} educational questions that help students master this content.
-Focus particularly on {focus_area}. Design questions that:
-- Encourage critical thinking beyond simple facts
-- Cover different topics within the material
-- Progress from easier concepts to more complex ones
 
-Study material:
----
-{context}
----
+class QuestionService:
+    # Hard cap on context tokens per generation prompt. Keeps request size
+    # (and therefore prompt-processing latency and TPM draw) predictable
+    # regardless of how large chunk size x k happens to be.
+    CONTEXT_TOKEN_BUDGET = 6000
 
-List {n} unique questions with numbers:"""
-        ]
+    def __init__(self, llm: ChatOpenAI = None):
+        self.llm = llm or _get_default_llm()
+        self.prompt = _QUESTION_PROMPT
+        if HAS_TIKTOKEN:
+            try:
+                self._enc = tiktoken.encoding_for_model("gpt-4o")
+            except Exception:
+                self._enc = tiktoken.get_encoding("cl100k_base")
+        else:
+            self._enc = None
         
         # Diverse query variations to get different content sections
         self.query_variations = [
@@ -94,77 +100,149 @@ List {n} unique questions with numbers:"""
             "synthesis and evaluation",
             "cause and effect relationships"
         ]
+
+        # Retriever wrappers keyed by (store id, search type, kwargs).
+        self._retriever_cache = {}
+
+        # Dedicated PRNG: cheaper than the module-level functions (no
+        # global-instance indirection) and keeps this service's draws
+        # independent of anything else seeding the global generator.
+        self._rng = random.Random()
     
     def generate_questions(self, vectorstore: FAISS, n: int = 5, k: int = 8) -> List[str]:
-        """Generate diverse study questions with randomness to avoid repetition."""
-        n = max(1, min(10, int(n)))
-        
+        """Synchronous wrapper around agenerate_questions for existing callers."""
+        return _run_async(self.agenerate_questions(vectorstore, n, k))
+
+    def _get_retriever(self, vectorstore: FAISS, search_type: str, search_kwargs: dict):
+        """Memoize retriever wrappers per store and parameter combination.
+
+        The (search_type, k, fetch_k) space is small, so repeated calls
+        reuse the wrapper instead of constructing a new pydantic object
+        each time. Score-threshold retrievers carry a random float and
+        would never repeat, so those are built fresh.
+        """
+        if "score_threshold" in search_kwargs:
+            return vectorstore.as_retriever(
+                search_type=search_type, search_kwargs=search_kwargs
+            )
+        key = (id(vectorstore), search_type, tuple(sorted(search_kwargs.items())))
+        retriever = self._retriever_cache.get(key)
+        if retriever is None:
+            if len(self._retriever_cache) > 64:
+                self._retriever_cache.clear()
+            retriever = vectorstore.as_retriever(
+                search_type=search_type, search_kwargs=search_kwargs
+            )
+            self._retriever_cache[key] = retriever
+        return retriever
+
+    async def _aprepare_chain(self, vectorstore: FAISS, n: int, k: int):
+        """Build the randomized generation chain and its inputs."""
         # Add randomness to retrieval parameters
-        random_k = random.randint(max(6, k-2), min(12, k+4))
-        random_fetch_k = random.randint(16, 24)
+        random_k = self._rng.randint(max(6, k-2), min(12, k+4))
+        random_fetch_k = self._rng.randint(16, 24)
         
         # Use random query to get different document chunks
-        random_query = random.choice(self.query_variations)
+        random_query = self._rng.choice(self.query_variations)
         
         # Randomly choose search type for variety
-        search_type = random.choice(["similarity", "mmr", "similarity_score_threshold"])
+        search_type = self._rng.choice(["similarity", "mmr", "similarity_score_threshold"])
         search_kwargs = {"k": random_k, "fetch_k": random_fetch_k}
         
         # For similarity_score_threshold, add score threshold
         if search_type == "similarity_score_threshold":
-            search_kwargs["score_threshold"] = random.uniform(0.3, 0.7)
+            search_kwargs["score_threshold"] = self._rng.uniform(0.3, 0.7)
             
-        retriever = vectorstore.as_retriever(
-            search_type=search_type,
-            search_kwargs=search_kwargs
-        )
-        
+        retriever = self._get_retriever(vectorstore, search_type, search_kwargs)
+
         # Get documents with random query
-        docs = retriever.get_relevant_documents(random_query)
-        
-        # Randomly shuffle and sample documents for variety
-        if len(docs) > random_k:
-            docs = random.sample(docs, random_k)
-        else:
-            random.shuffle(docs)
-            
-        # Create context with random ordering
-        context = "\n\n".join(d.page_content for d in docs)
-        
-        # Randomly select prompt template and focus area
-        prompt_template = random.choice(self.question_prompts)
-        focus_area = random.choice(self.focus_areas)
-        
-        # Create dynamic prompt
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", prompt_template)
-        ])
-        
-        # Generate questions with randomness
-        chain = (prompt | self.llm | StrOutputParser())
-        
-        # Add session ID for additional randomness
-        session_id = str(uuid.uuid4())[:8]
-        
+        docs = await retriever.ainvoke(random_query)
+
+        # Keep the retriever's order: shuffling the chunks guaranteed a
+        # different prompt every call, which defeated OpenAI's prompt cache
+        # whenever the same k docs came back. Retrieval randomness (query,
+        # k, search type) still varies which docs are chosen.
+        docs = docs[:random_k]
+        # Overlapping PDF chunks can retrieve near-identical text; drop
+        # exact repeats before paying for them on the OpenAI wire.
+        context = "\n\n".join(dict.fromkeys(d.page_content for d in docs))
+        if self._enc is not None:
+            tokens = self._enc.encode(context)
+            if len(tokens) > self.CONTEXT_TOKEN_BUDGET:
+                context = self._enc.decode(tokens[:self.CONTEXT_TOKEN_BUDGET])
+
+        # Randomly select focus area for variety
+        focus_area = self._rng.choice(self.focus_areas)
+
+        chain = (self.prompt | self.llm | StrOutputParser())
+
+        inputs = {
+            "n": n,
+            "context": context,
+            "focus_area": focus_area,
+        }
+        return chain, inputs
+
+    async def agenerate_questions(self, vectorstore: FAISS, n: int = 5, k: int = 8) -> List[str]:
+        """Generate diverse study questions with randomness to avoid repetition.
+
+        Async so the FastAPI endpoint can await it without pinning the event
+        loop for the duration of the retrieval and LLM round-trips.
+        """
+        n = max(1, min(10, int(n)))
+        context = None
+
         try:
-            raw = chain.invoke({
-                "n": n, 
-                "context": context, 
-                "focus_area": focus_area,
-                "session": session_id
-            })
-            
+            chain, inputs = await self._aprepare_chain(vectorstore, n, k)
+            context = inputs["context"]
+            raw = await chain.ainvoke(inputs)
+
             # Parse questions more robustly
             questions = self._parse_questions(raw, n)
-            
+
             # Ensure uniqueness and variety
             questions = self._ensure_question_diversity(questions, n)
-            
+
             return questions[:n]
-            
+
         except Exception as e:
-            # Fallback with basic prompt if advanced generation fails
-            return self._fallback_generation(vectorstore, n, k)
+            # Fallback with basic prompt if advanced generation fails;
+            # reuse the already-retrieved context when we got that far.
+            return await self._fallback_generation(vectorstore, n, k, context=context)
+
+    async def astream_questions(self, vectorstore: FAISS, n: int = 5, k: int = 8):
+        """Yield questions one by one as the LLM streams its output.
+
+        Lets callers render the first question after a few hundred
+        milliseconds instead of waiting for the full numbered list.
+        """
+        n = max(1, min(10, int(n)))
+        chain, inputs = await self._aprepare_chain(vectorstore, n, k)
+        emitted: List[str] = []
+        emitted_words: List[Set[str]] = []
+
+        def fresh_questions(text):
+            for q in self._parse_questions(text, n):
+                words = set(q.lower().split())
+                if len(emitted) < n and not any(
+                    self._jaccard(words, seen) > _SIMILARITY_THRESHOLD
+                    for seen in emitted_words
+                ):
+                    emitted.append(q)
+                    emitted_words.append(words)
+                    yield q
+
+        buffer = ""
+        async for token in chain.astream(inputs):
+            buffer += token
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                for q in fresh_questions(line):
+                    yield q
+            if len(emitted) >= n:
+                return
+        for q in fresh_questions(buffer):
+            yield q
     
     def _parse_questions(self, raw_output: str, expected_count: int) -> List[str]:
         """Parse and clean questions from LLM output."""
@@ -177,13 +255,8 @@ List {n} unique questions with numbers:"""
                 continue
                 
             # Remove numbering (1., 2), bullet points, etc.
-            cleaned = line
-            for prefix in ['1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.', '10.', 
-                          '•', '-', '*', '1)', '2)', '3)', '4)', '5)', '6)', '7)', '8)', '9)', '10)']:
-                if cleaned.startswith(prefix):
-                    cleaned = cleaned[len(prefix):].strip()
-                    break
-            
+            cleaned = _PREFIX_RE.sub("", line, count=1).strip()
+
             # Only include actual questions
             if cleaned and (cleaned.endswith('?') or len(cleaned) > 10):
                 questions.append(cleaned)
@@ -194,53 +267,56 @@ List {n} unique questions with numbers:"""
         """Ensure questions are diverse and not repetitive."""
         if not questions:
             return []
-            
-        # Remove duplicates while preserving order
-        seen = set()
+
+        # Near-duplicate removal, preserving order. Word sets are built once
+        # per question and compared directly, instead of re-splitting both
+        # sides of every pairwise check.
+        seen_words: List[Set[str]] = []
         unique_questions = []
-        
+
         for q in questions:
-            q_lower = q.lower().strip()
-            # Check for substantial similarity (not just exact duplicates)
+            words = set(q.lower().strip().split())
             is_similar = any(
-                self._are_questions_similar(q_lower, existing.lower()) 
-                for existing in seen
+                self._jaccard(words, existing) > _SIMILARITY_THRESHOLD
+                for existing in seen_words
             )
-            
+
             if not is_similar:
-                seen.add(q_lower)
+                seen_words.append(words)
                 unique_questions.append(q)
-        
+
         return unique_questions
-    
-    def _are_questions_similar(self, q1: str, q2: str, threshold: float = 0.7) -> bool:
-        """Check if two questions are too similar."""
-        # Simple similarity check based on word overlap
-        words1 = set(q1.split())
-        words2 = set(q2.split())
-        
+
+    @staticmethod
+    def _jaccard(words1: Set[str], words2: Set[str]) -> float:
+        """Word-set Jaccard similarity of two questions."""
         if not words1 or not words2:
-            return False
-            
-        intersection = len(words1 & words2)
-        union = len(words1 | words2)
-        
-        jaccard_similarity = intersection / union if union > 0 else 0
-        return jaccard_similarity > threshold
+            return 0.0
+        return len(words1 & words2) / len(words1 | words2)
+
+    def _are_questions_similar(self, q1: str, q2: str, threshold: float = _SIMILARITY_THRESHOLD) -> bool:
+        """Check if two questions are too similar."""
+        return self._jaccard(set(q1.split()), set(q2.split())) > threshold
     
-    def _fallback_generation(self, vectorstore: FAISS, n: int, k: int) -> List[str]:
-        """Fallback question generation if advanced method fails."""
+    async def _fallback_generation(self, vectorstore: FAISS, n: int, k: int, context: str = None) -> List[str]:
+        """Fallback question generation if advanced method fails.
+
+        When the primary path already retrieved and joined a context
+        before failing, it is passed in so the fallback skips a second
+        FAISS search and string reassembly.
+        """
         try:
-            retriever = vectorstore.as_retriever(search_kwargs={"k": k})
-            docs = retriever.get_relevant_documents("study questions from content")
-            context = "\n\n".join(d.page_content for d in docs)
-            
+            if context is None:
+                retriever = self._get_retriever(vectorstore, "similarity", {"k": k})
+                docs = await retriever.ainvoke("study questions from content")
+                context = "\n\n".join(d.page_content for d in docs)
+
             basic_prompt = ChatPromptTemplate.from_messages([
                 ("system", f"Create {n} different study questions from this content:\n\n{{context}}\n\nQuestions:")
             ])
-            
+
             chain = (basic_prompt | self.llm | StrOutputParser())
-            raw = chain.invoke({"context": context})
+            raw = await chain.ainvoke({"context": context})
             
             questions = [q.strip() for q in raw.split('\n') if q.strip() and '?' in q]
             return questions[:n] if questions else [f"What are the key concepts in this material? (Question {i+1})" for i in range(n)]
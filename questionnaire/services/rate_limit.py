@@ -0,0 +1,56 @@
+"""Client-side pacing for OpenAI requests."""
+import asyncio
+import os
+import threading
+import time
+
+
+class OpenAILimiter:
+    """Async token bucket over both requests/minute and tokens/minute.
+
+    OpenAI enforces RPM and TPM quotas server-side with 429s, and hitting
+    them puts LangChain's exponential-backoff retries on the critical
+    path. Pacing locally is cheaper: acquire() sleeps just long enough for
+    both buckets to refill, so a burst of evaluations smooths out instead
+    of failing and retrying. Limits come from the OPENAI_RPM / OPENAI_TPM
+    env vars; set them to match the account tier.
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None):
+        self.rpm = float(rpm or os.getenv("OPENAI_RPM", 500))
+        self.tpm = float(tpm or os.getenv("OPENAI_TPM", 200_000))
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._last_refill = time.monotonic()
+        # A threading.Lock, not asyncio.Lock: the sync wrappers run each
+        # call in a fresh event loop, and an asyncio.Lock binds to the
+        # first loop that contends for it, breaking every later loop. The
+        # lock is only held for the refill arithmetic; sleeping happens
+        # outside it, so holding a thread lock briefly is safe.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough prompt-size estimate (~4 characters per token)."""
+        return max(1, len(text) // 4)
+
+    async def acquire(self, est_tokens: int = 1) -> None:
+        """Block until both buckets can cover one request of est_tokens."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._last_refill
+                self._last_refill = now
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+                if self._requests >= 1 and self._tokens >= est_tokens:
+                    self._requests -= 1
+                    self._tokens -= est_tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.rpm
+                wait_tokens = (est_tokens - self._tokens) * 60 / self.tpm
+            await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+
+# Shared across services so every OpenAI call draws from the same budget.
+openai_limiter = OpenAILimiter()
@@ -1,92 +1,61 @@
 import streamlit as st
 from api_client import get_api_client
+from ui_styles import apply_section_styling
+import base64
+import json
 import os
+import zlib
 
 # ---------- Configuration ----------
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 api_client = get_api_client(API_BASE_URL)
 
 # ---------- Custom Styling ----------
-def apply_section_styling():
-    st.markdown("""
-    <style>
-    .upload-section {
-        background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #2196F3;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(33, 150, 243, 0.1);
-    }
-    .index-section {
-        background: linear-gradient(135deg, #E8F5E2 0%, #C8E6C9 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #4CAF50;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(76, 175, 80, 0.1);
-    }
-    .question-section {
-        background: linear-gradient(135deg, #F3E5F5 0%, #E1BEE7 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #9C27B0;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(156, 39, 176, 0.1);
-    }
-    .results-section {
-        background: linear-gradient(135deg, #FFF3E0 0%, #FFE0B2 100%);
-        padding: 25px;
-        border-radius: 15px;
-        border-left: 5px solid #FF9800;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(255, 152, 0, 0.1);
-    }
-    .section-header {
-        color: #1A237E;
-        font-weight: 600;
-        margin-bottom: 15px;
-        font-size: 1.3rem;
-    }
-    .stButton > button {
-        background: linear-gradient(45deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 0.5rem 1.5rem;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(102, 126, 234, 0.3);
-    }
-    .status-indicator {
-        padding: 10px;
-        border-radius: 10px;
-        margin: 10px 0;
-    }
-    .status-healthy {
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        color: #155724;
-    }
-    .status-unhealthy {
-        background-color: #f8d7da;
-        border: 1px solid #f5c6cb;
-        color: #721c24;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+# Shared with the direct app; see ui_styles.py / assets/styles.css.
 
 # ---------- Helper Functions ----------
+@st.cache_data(ttl=30, show_spinner=False)
 def check_api_status():
-    """Check if API is available and healthy"""
+    """Check API health and prefetch collections in one concurrent round-trip.
+
+    Cached for 30s: every widget interaction reruns the whole script, and
+    without the cache each rerun paid two HTTP round-trips before the page
+    could draw. Indexing a PDF clears the cache so new collections appear.
+    """
     try:
-        health = api_client.health_check()
-        return health, True
+        health, collections = api_client.fetch_status_and_collections()
+        return health, True, collections
     except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}, False
+        return {"status": "unhealthy", "error": str(e)}, False, []
+
+def _encode_questions(questions, collection):
+    """Pack questions + collection into a URL-safe query-param token."""
+    payload = json.dumps({"c": collection, "q": questions}).encode()
+    return base64.urlsafe_b64encode(zlib.compress(payload)).decode()
+
+def _decode_questions(token):
+    """Inverse of _encode_questions; returns (None, None) on a bad token."""
+    try:
+        payload = zlib.decompress(base64.urlsafe_b64decode(token.encode()))
+        data = json.loads(payload)
+        return data["q"], data["c"]
+    except Exception:
+        return None, None
+
+def restore_questions_from_url():
+    """Rehydrate generated questions after a page reload.
+
+    A browser refresh wipes session_state; without this the user had to
+    pay for a fresh LLM generation just to see the same questions again.
+    The list is small (<=10 short strings), so it compresses comfortably
+    into a single query parameter.
+    """
+    if "questions" in st.session_state or "qs" not in st.query_params:
+        return
+    questions, collection = _decode_questions(st.query_params["qs"])
+    if questions:
+        st.session_state["questions"] = questions
+        st.session_state["current_collection"] = collection
 
 def display_status_indicator(health_data, is_healthy):
     """Display API status indicator"""
@@ -113,9 +82,14 @@ def main():
     st.title("🎓 PDF Tutor: Index, Questions & Answer Evaluation")
     st.markdown(f"*Connected to API: {API_BASE_URL}*")
     
-    # Check API status
-    health_data, is_healthy = check_api_status()
+    restore_questions_from_url()
+
+    # Check API status (also prefetches the collection list)
+    health_data, is_healthy, collections = check_api_status()
     display_status_indicator(health_data, is_healthy)
+    if st.button("🔄 Refresh status", help="Re-check the API and collection list now"):
+        check_api_status.clear()
+        st.rerun()
     
     if not is_healthy:
         st.error("⚠️ Cannot connect to API backend. Please ensure the FastAPI server is running.")
@@ -142,6 +116,7 @@ def main():
                 try:
                     with st.spinner("Indexing PDF... This may take a moment."):
                         index_result = api_client.index_pdf(uploaded_file.name, collection)
+                    check_api_status.clear()  # pick up the new collection
                     st.success(f"✅ {index_result['message']}")
                 except Exception as e:
                     st.error(f"❌ Failed to index PDF: {str(e)}")
@@ -158,8 +133,6 @@ def main():
     st.markdown('<h3 class="section-header">🎯 Practice: Generate Questions and Submit Answers</h3>', unsafe_allow_html=True)
     
     try:
-        collections = api_client.list_collections()
-        
         if not collections:
             st.info("📚 No vector stores found yet. Index a PDF above first.")
         else:
@@ -168,10 +141,22 @@ def main():
             
             if st.button("✨ Generate Questions"):
                 try:
+                    # Render each question as it streams in, so the first
+                    # one shows up in well under a second instead of after
+                    # the whole list has been generated.
+                    questions = []
+                    placeholder = st.empty()
                     with st.spinner("Generating questions... Please wait."):
-                        questions = api_client.generate_questions(chosen, int(n_q))
+                        for q in api_client.stream_questions(chosen, int(n_q)):
+                            questions.append(q)
+                            placeholder.markdown("\n\n".join(
+                                f"**{i}.** {text}" for i, text in enumerate(questions, start=1)
+                            ))
+                    placeholder.empty()  # the answer form below re-renders them
                     st.session_state["questions"] = questions
                     st.session_state["current_collection"] = chosen
+                    # Survive page reloads without another LLM call.
+                    st.query_params["qs"] = _encode_questions(questions, chosen)
                 except Exception as e:
                     st.error(f"❌ Failed to generate questions: {str(e)}")
             
@@ -1,14 +1,21 @@
+import asyncio
 import unittest
 import re
 import json
 
+from services.rate_limit import OpenAILimiter
+
 
 def _extract_json(s: str) -> dict:
-    """Copy of the _extract_json function from app.py for testing"""
+    """Copy of the _extract_json function from evaluation_service.py for testing"""
     s = s.strip()
-    s = re.sub(r"^```(?:json)?\\s*|```$", "", s, flags=re.IGNORECASE|re.MULTILINE).strip()
-    if "{" in s and "}" in s:
-        s = s[s.find("{"): s.rfind("}")+1]
+    i, j = s.find("{"), s.rfind("}")
+    if 0 <= i < j:
+        try:
+            return json.loads(s[i:j + 1])
+        except Exception:
+            pass
+    s = re.sub(r"^```(?:json)?\s*|\s*```$", "", s, flags=re.IGNORECASE|re.MULTILINE).strip()
     try:
         return json.loads(s)
     except Exception:
@@ -46,5 +53,48 @@ class TestExtractJson(unittest.TestCase):
         self.assertEqual(result["reasoning"], "Excellent")
 
 
+class TestOpenAILimiter(unittest.TestCase):
+
+    def test_acquire_within_budget(self):
+        """Acquiring within both budgets should not block"""
+        limiter = OpenAILimiter(rpm=600, tpm=60000)
+        asyncio.run(limiter.acquire(est_tokens=100))
+        self.assertLessEqual(limiter._requests, 599)
+        self.assertLessEqual(limiter._tokens, 59900)
+
+    def test_acquire_waits_for_refill(self):
+        """An empty bucket should make acquire sleep until it refills"""
+        limiter = OpenAILimiter(rpm=6000, tpm=600000)
+        limiter._requests = 0
+
+        async def timed_acquire():
+            start = asyncio.get_event_loop().time()
+            await limiter.acquire(est_tokens=1)
+            return asyncio.get_event_loop().time() - start
+
+        elapsed = asyncio.run(timed_acquire())
+        # One request refills in 60/6000 = 0.01s
+        self.assertGreaterEqual(elapsed, 0.005)
+
+    def test_contested_acquire_across_event_loops(self):
+        """Pacing must keep working when each call runs in a fresh loop"""
+        limiter = OpenAILimiter(rpm=6000, tpm=600000)
+
+        async def burst():
+            await asyncio.gather(limiter.acquire(1), limiter.acquire(1))
+
+        # Two bursts, two loops; an asyncio primitive bound to the first
+        # loop would blow up (and deadlock) on the second.
+        limiter._requests = 0
+        asyncio.run(burst())
+        limiter._requests = 0
+        asyncio.run(burst())
+
+    def test_estimate_tokens(self):
+        """Estimate is ~4 chars per token with a floor of 1"""
+        self.assertEqual(OpenAILimiter.estimate_tokens("x" * 400), 100)
+        self.assertEqual(OpenAILimiter.estimate_tokens(""), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
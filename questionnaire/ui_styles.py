@@ -0,0 +1,17 @@
+"""Shared CSS for the Streamlit frontends."""
+from pathlib import Path
+
+import streamlit as st
+
+_CSS_FILE = Path(__file__).parent / "assets" / "styles.css"
+
+
+@st.cache_data
+def _css_html() -> str:
+    """Read and wrap the stylesheet once per process instead of per rerun."""
+    return f"<style>\n{_CSS_FILE.read_text()}\n</style>"
+
+
+def apply_section_styling():
+    """Inject the shared section styling into the current page."""
+    st.markdown(_css_html(), unsafe_allow_html=True)